@@ -1,44 +1,20 @@
 import socket
 import os
 
+import ftp_client # Reusable protocol helpers shared with the scripted client
+from ftp_client import FTPError
+
 HOST = 'localhost'
 PORT = 6666
 
 def send_file(sock, filepath):
     """Handles sending a file to the server with proper handshakes."""
     try:
-        file_size = os.path.getsize(filepath)
-        
-        # 1. Client waits for server to be ready for size
-        response = sock.recv(1024).decode()
-        if response != "READY_FOR_UPLOAD_SIZE":
-            print(f"Server not ready for upload size: {response}")
-            return False
-
-        # 2. Client sends file size
-        sock.send(str(file_size).encode())
-        
-        # 3. Client waits for quota check result
-        response = sock.recv(1024).decode()
-        if response == "Insufficient quota":
-            print("Insufficient quota to upload the file.")
-            return False
-        elif response != "QUOTA_OK":
-            print(f"Unexpected server response regarding quota: {response}")
-            return False
-        
-        # 4. Client sends file data
-        with open(filepath, 'rb') as f:
-            while True:
-                data = f.read(1024)
-                if not data:
-                    break
-                sock.sendall(data)
-        
-        # 5. Client waits for server's final confirmation
-        final_upload_response = sock.recv(1024).decode()
-        print(final_upload_response)
-        return True 
+        print(ftp_client.send_file(sock, filepath))
+        return True
+    except FTPError as e:
+        print(f"Upload refused by server: {e}")
+        return False
     except socket.error as e:
         print(f"Socket error during file send: {e}")
         return False
@@ -46,33 +22,15 @@ def send_file(sock, filepath):
         print(f"Error during file send: {e}")
         return False
 
-def receive_file(sock, filepath, file_size):
+def receive_file(sock, filepath, file_size, data=b''):
     """Handles receiving a file from the server, reading exactly file_size bytes."""
     try:
-        received_bytes = 0
-        # Ensure the directory for the file exists
-        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
-        
-        with open(filepath, 'wb') as f:
-            while received_bytes < file_size:
-                bytes_to_receive = min(1024, file_size - received_bytes)
-                if bytes_to_receive == 0: 
-                    break # Should not happen if file_size is correct
-                data = sock.recv(bytes_to_receive)
-                if not data: # Server disconnected or error during transfer
-                    print(f"Error: Server disconnected during download of '{os.path.basename(filepath)}'. Incomplete file.")
-                    # Optionally clean up incomplete file: os.remove(filepath)
-                    return False
-                f.write(data)
-                received_bytes += len(data)
-        
-        if received_bytes == file_size:
-            print(f"Successfully downloaded '{os.path.basename(filepath)}' ({received_bytes} bytes).")
-            return True
-        else:
-            print(f"Error: Incomplete download for '{os.path.basename(filepath)}'. Expected {file_size}, received {received_bytes}.")
-            # Optionally clean up incomplete file: os.remove(filepath)
-            return False
+        received_bytes = ftp_client.receive_file(sock, filepath, file_size, data)
+        print(f"Successfully downloaded '{os.path.basename(filepath)}' ({received_bytes} bytes).")
+        return True
+    except FTPError as e:
+        print(f"Error: {e}")
+        return False
     except socket.error as e:
         print(f"Socket error during file reception: {e}")
         return False
@@ -101,13 +59,13 @@ while not authenticated:
         request = f"{action} {username} {password}"
         try:
             sock.send(request.encode())
-            response = sock.recv(1024).decode()
+            response = ftp_client.recv_reply(sock)
             print(response)
             if response == "Authenticated" or response == "Registered":
                 authenticated = True
             elif "Bad request" in response:
                 print("Server responded with Bad request. Please check format.")
-        except socket.error as e:
+        except (socket.error, FTPError) as e:
             print(f"Socket error during authentication: {e}. Connection lost.")
             break # Exit if connection fails
     else:
@@ -121,6 +79,7 @@ if not authenticated:
 # Commands explanation
 print("\n--- Available Commands ---")
 print("ls [path]                - List directory contents")
+print("find [path]              - List all files and directories below path")
 print("pwd                      - Print current 'working' directory (confined view)")
 print("mkdir <dirname>          - Create a new directory")
 print("rmdir <dirname>          - Remove a directory (recursively deletes contents)")
@@ -131,6 +90,7 @@ print("upload <local_file>      - Upload a file from your computer to server")
 print("download <remote_file>   - Download a file from server to your computer")
 print("exit                     - Disconnect from the server")
 print("stop                     - Stop the server (admin only)")
+print("cachestats               - Show file cache hit/miss counters (admin only)")
 print("--------------------------")
 
 while True:
@@ -165,24 +125,22 @@ while True:
             sock.send(request.encode()) # Send the download command
             
             # Client waits for server's DOWNLOAD_READY response with file size
-            response_from_server = sock.recv(1024).decode()
-            if response_from_server.startswith('DOWNLOAD_READY'):
-                try:
-                    file_size = int(response_from_server.split()[1])
-                    # Determine local path for downloaded file (e.g., in current working dir)
-                    local_download_path = os.path.join(os.getcwd(), os.path.basename(remote_filename))
-                    receive_file(sock, local_download_path, file_size)
-                except (ValueError, IndexError) as e:
-                    print(f"Error parsing download size from server: {response_from_server} ({e})")
+            response_from_server, data = ftp_client.recv_line(sock)
+            try:
+                file_size = ftp_client.parse_download_header(response_from_server)
+            except FTPError as e:
+                print(e) # This would be "File does not exist" or an error message
             else:
-                print(response_from_server) # This would be "File does not exist" or an error message
+                # Determine local path for downloaded file (e.g., in current working dir)
+                local_download_path = os.path.join(os.getcwd(), os.path.basename(remote_filename))
+                receive_file(sock, local_download_path, file_size, data)
 
         elif command == 'copy':
             if len(command_parts) < 3:
                 print("Usage: copy <source_file_or_dir> <destination_file_or_dir>")
                 continue
             sock.send(request.encode())
-            response = sock.recv(4096).decode() # Increased buffer for potentially long error messages
+            response = ftp_client.recv_reply(sock) # Reads the whole reply, however long
             print(response)
 
         else: # For other commands (pwd, ls, mkdir, rmdir, rmfile, rename, exit, stop)
@@ -190,13 +148,13 @@ while True:
                 continue
 
             sock.send(request.encode())
-            response = sock.recv(4096).decode() # Increased buffer for potentially long error messages
+            response = ftp_client.recv_reply(sock) # Reads the whole reply, however long
             print(response)
             
             if response == 'exit' or response == 'Server stopping':
                 break
 
-    except socket.error as e:
+    except (socket.error, ftp_client.FTPConnectionError) as e:
         print(f"Socket error: {e}. Connection closed.")
         break
     except Exception as e:
@@ -4,6 +4,9 @@ import threading
 import logging
 import json
 import shutil # Added for copy and rmtree
+import stat
+import time
+from collections import OrderedDict
 
 # Base directory where all user data will be stored
 # This is separate from the server code's directory
@@ -12,6 +15,12 @@ base_user_data_dir = os.path.join(os.getcwd(), 'users_data') # Renamed for clari
 server_running = True  # Variable to control server state
 client_threads = []  # List to store client threads
 server_lock = threading.Lock()  # Lock for server state synchronization
+users_lock = threading.RLock()  # Serializes reads and read-modify-writes of users.json
+
+# Hot-file read cache limits
+CACHE_MAX_FILE_SIZE = 256 * 1024  # Only files up to this size are cached
+CACHE_MAX_BYTES = 64 * 1024 * 1024  # Total bytes held by the cache
+CACHE_STATS_INTERVAL = 300  # Seconds between cache hit/miss log entries
 
 # Logging setup
 # Configure loggers to prevent propagation to root and duplicate messages
@@ -34,16 +43,18 @@ conn_logger.propagate = False
 
 # Load user information from file
 def load_users():
-    if os.path.exists('users.json'):
-        with open('users.json', 'r') as f:
-            return json.load(f)
-    else:
-        return {}
+    with users_lock:
+        if os.path.exists('users.json'):
+            with open('users.json', 'r') as f:
+                return json.load(f)
+        else:
+            return {}
 
 # Save user information to file
 def save_users(users):
-    with open('users.json', 'w') as f:
-        json.dump(users, f)
+    with users_lock:
+        with open('users.json', 'w') as f:
+            json.dump(users, f)
 
 # Authenticate user
 def authenticate_user(username, password):
@@ -57,28 +68,29 @@ def authenticate_user(username, password):
 
 # Register new user
 def register_user(username, password):
-    users = load_users()
-    if username in users:
-        return False
-    else:
-        # Create base directory for all user data if it doesn't exist
-        if not os.path.exists(base_user_data_dir):
-            os.makedirs(base_user_data_dir)
-            file_logger.info(f"Created base user data directory: {base_user_data_dir}")
-
-        # Create user's specific base directory (e.g., users_data/username/)
-        user_base_dir = os.path.join(base_user_data_dir, username)
-        os.makedirs(user_base_dir)
+    with users_lock:
+        users = load_users()
+        if username in users:
+            return False
+        else:
+            # Create base directory for all user data if it doesn't exist
+            if not os.path.exists(base_user_data_dir):
+                os.makedirs(base_user_data_dir)
+                file_logger.info(f"Created base user data directory: {base_user_data_dir}")
+
+            # Create user's specific base directory (e.g., users_data/username/)
+            user_base_dir = os.path.join(base_user_data_dir, username)
+            os.makedirs(user_base_dir)
         
-        # Create the 'docs' directory inside the user's base directory
-        # This will be the actual root for user's file operations
-        user_docs_dir = os.path.join(user_base_dir, 'docs')
-        os.makedirs(user_docs_dir)
+            # Create the 'docs' directory inside the user's base directory
+            # This will be the actual root for user's file operations
+            user_docs_dir = os.path.join(user_base_dir, 'docs')
+            os.makedirs(user_docs_dir)
         
-        users[username] = {'password': password, 'quota': 1024 * 1024 * 10}  # 10 MB quota
-        save_users(users)
-        auth_logger.info(f"New user {username} registered. User docs directory created at {user_docs_dir}")
-        return True
+            users[username] = {'password': password, 'quota': 1024 * 1024 * 10}  # 10 MB quota
+            save_users(users)
+            auth_logger.info(f"New user {username} registered. User docs directory created at {user_docs_dir}")
+            return True
 
 def get_safe_path(base_dir, relative_path):
     """
@@ -101,6 +113,78 @@ def get_safe_path(base_dir, relative_path):
     
     return abs_path
 
+def send_reply(conn, message):
+    """
+    Sends one reply to the client. Every reply ends with a newline so clients
+    can tell where it stops, however long it is or whatever data follows it.
+    """
+    conn.sendall((message.replace('\n', ' ') + '\n').encode())
+
+class FileCache:
+    """
+    LRU in-memory cache of small file contents for repeated downloads.
+    Entries are keyed by path and validated against the file's mtime, size and
+    inode, so files changed behind the server's back are never served stale.
+    """
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, max_file_size=CACHE_MAX_FILE_SIZE):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.entries = OrderedDict()  # path -> ((mtime_ns, size, inode), data)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, path, st):
+        """
+        Returns the contents of path (whose os.stat result is st), reading and
+        caching them on a miss. Returns None for files too large to cache.
+        """
+        if st.st_size > self.max_file_size:
+            return None
+        key = (st.st_mtime_ns, st.st_size, st.st_ino)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] == key:
+                self.entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) != st.st_size: # File changed while reading, don't cache it
+            return None
+
+        with self.lock:
+            self._remove(path)
+            self.entries[path] = (key, data)
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+        return data
+
+    def invalidate(self, path):
+        """Drops path and, if it is a directory, everything cached below it."""
+        prefix = path.rstrip(os.sep) + os.sep
+        with self.lock:
+            self._remove(path)
+            for cached_path in [p for p in self.entries if p.startswith(prefix)]:
+                self._remove(cached_path)
+
+    def _remove(self, path):
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.total_bytes -= len(entry[1])
+
+    def stats(self):
+        with self.lock:
+            return f"{self.hits} hits, {self.misses} misses, {len(self.entries)} files ({self.total_bytes} bytes) cached"
+
+file_cache = FileCache()
+
 # Function to process client requests (excluding file transfers, exit, stop)
 # ... (previous code) ...
 
@@ -138,6 +222,28 @@ def process_command(req, username):
         except OSError as e:
             return f"Error listing directory: {e}"
 
+    elif command == 'find':
+        # Recursive listing in one reply, so clients can walk a tree without an 'ls' per entry.
+        # Paths are relative to the user's docs folder; directories end with '/'.
+        root = os.path.realpath(user_docs_dir)
+        target_dir = root
+        if len(req_parts) > 1:
+            safe_target_dir = get_safe_path(user_docs_dir, req_parts[1])
+            if safe_target_dir is None or not os.path.isdir(safe_target_dir):
+                return f"Error: Directory '{req_parts[1]}' does not exist or is not accessible."
+            target_dir = safe_target_dir
+
+        entries = []
+        for dirpath, dirnames, filenames in os.walk(target_dir):
+            dirnames.sort()
+            rel_dir = os.path.relpath(dirpath, root)
+            prefix = '' if rel_dir == '.' else rel_dir.replace(os.sep, '/') + '/'
+            entries.extend(prefix + d + '/' for d in dirnames)
+            entries.extend(prefix + f for f in sorted(filenames))
+        if not entries:
+            return "(empty directory)"
+        return '; '.join(entries)
+
     # ... (rest of the process_command function) ...
 
     elif command == 'mkdir':
@@ -165,6 +271,7 @@ def process_command(req, username):
         try:
             if os.path.exists(safe_dirname) and os.path.isdir(safe_dirname):
                 shutil.rmtree(safe_dirname) # Recursively remove directory
+                file_cache.invalidate(safe_dirname)
                 file_logger.info(f"User {username} removed directory (recursively): {safe_dirname}")
                 return f"Directory removed: {dirname_client}"
             else:
@@ -181,6 +288,7 @@ def process_command(req, username):
         try:
             if os.path.exists(safe_filename) and os.path.isfile(safe_filename):
                 os.remove(safe_filename)
+                file_cache.invalidate(safe_filename)
                 file_logger.info(f"User {username} removed file: {safe_filename}")
                 return f"File removed: {filename_client}"
             else:
@@ -201,6 +309,8 @@ def process_command(req, username):
         try:
             if os.path.exists(safe_old_path):
                 os.rename(safe_old_path, safe_new_path)
+                file_cache.invalidate(safe_old_path)
+                file_cache.invalidate(safe_new_path)
                 file_logger.info(f"User {username} renamed {safe_old_path} to {safe_new_path}")
                 return f"Renamed from {old_name_client} to {new_name_client}"
             else:
@@ -228,6 +338,7 @@ def process_command(req, username):
 
             if os.path.isfile(safe_source_path):
                 shutil.copy2(safe_source_path, safe_destination_path) # copy2 preserves metadata
+                file_cache.invalidate(safe_destination_path)
                 file_logger.info(f"User {username} copied file from {safe_source_path} to {safe_destination_path}")
                 return f"Copied file from '{source_client}' to '{destination_client}'"
             elif os.path.isdir(safe_source_path):
@@ -243,6 +354,7 @@ def process_command(req, username):
                     return f"Error: Destination directory '{destination_client}' already exists. Please provide a non-existent path for directory copy."
                 
                 shutil.copytree(safe_source_path, safe_destination_path)
+                file_cache.invalidate(safe_destination_path)
                 file_logger.info(f"User {username} copied directory from {safe_source_path} to {safe_destination_path}")
                 return f"Copied directory from '{source_client}' to '{destination_client}'"
             else:
@@ -274,20 +386,20 @@ def handle_client(conn, addr):
                     action, received_username, password = req_parts
                     if action == 'login':
                         if authenticate_user(received_username, password):
-                            conn.send("Authenticated".encode())
+                            send_reply(conn, "Authenticated")
                             username = received_username 
                             conn_logger.info(f"User {username} authenticated from {addr}")
                         else:
-                            conn.send("Authentication failed".encode())
+                            send_reply(conn, "Authentication failed")
                     elif action == 'register':
                         if register_user(received_username, password):
-                            conn.send("Registered".encode())
+                            send_reply(conn, "Registered")
                             username = received_username 
                             conn_logger.info(f"New user {username} registered from {addr}")
                         else:
-                            conn.send("Registration failed. User may already exist.".encode())
+                            send_reply(conn, "Registration failed. User may already exist.")
                 else:
-                    conn.send("Bad request: Format 'login <username> <password>' or 'register <username> <password>'".encode())
+                    send_reply(conn, "Bad request: Format 'login <username> <password>' or 'register <username> <password>'")
             # Phase 2: Handle authenticated commands
             else:
                 request = conn.recv(1024).decode()
@@ -298,7 +410,7 @@ def handle_client(conn, addr):
 
                 command_parts = request.split()
                 if not command_parts: # Empty request
-                    conn.send("".encode())
+                    send_reply(conn, "")
                     continue
 
                 command = command_parts[0].lower()
@@ -306,100 +418,127 @@ def handle_client(conn, addr):
 
                 # Ensure user's docs directory exists (safety check, should be created on registration)
                 if not os.path.exists(user_docs_dir):
-                    conn.send(f"Error: Your user data directory '{user_docs_dir}' does not exist. Please contact support.".encode())
+                    send_reply(conn, f"Error: Your user data directory '{user_docs_dir}' does not exist. Please contact support.")
                     file_logger.error(f"User docs directory missing for {username} at {user_docs_dir}")
                     break
 
                 if command == 'upload':
                     if len(command_parts) < 2:
-                        conn.send("Usage: upload <filename>".encode())
+                        send_reply(conn, "Usage: upload <filename>")
                         continue
                     filename_client = command_parts[1]
                     safe_filepath = get_safe_path(user_docs_dir, filename_client)
                     
                     if safe_filepath is None:
-                        conn.send(f"Access denied: Cannot upload to '{filename_client}' outside your designated area.".encode())
+                        send_reply(conn, f"Access denied: Cannot upload to '{filename_client}' outside your designated area.")
+                        continue
+
+                    # Refuse targets that cannot be written before any quota is reserved
+                    if os.path.isdir(safe_filepath):
+                        send_reply(conn, f"Error: '{filename_client}' is a directory.")
+                        continue
+                    if not os.path.isdir(os.path.dirname(safe_filepath)):
+                        send_reply(conn, f"Error: Directory for '{filename_client}' does not exist.")
                         continue
 
                     # Handshake for upload: Server tells client it's ready for size
-                    conn.send("READY_FOR_UPLOAD_SIZE".encode()) 
+                    send_reply(conn, "READY_FOR_UPLOAD_SIZE") 
 
                     # Server waits for file size
                     file_size_str = conn.recv(1024).decode()
                     try:
                         file_size = int(file_size_str)
                     except ValueError:
-                        conn.send("Invalid file size provided by client. Aborting upload.".encode())
+                        send_reply(conn, "Invalid file size provided by client. Aborting upload.")
                         file_logger.warning(f"User {username} sent invalid file size: {file_size_str}")
                         continue 
 
-                    users = load_users() # Reload users for up-to-date quota
-                    user_quota = users[username]['quota']
-                    
-                    if file_size > user_quota:
-                        conn.send("Insufficient quota".encode())
+                    with users_lock: # Parallel uploads by the same user must not lose quota updates
+                        users = load_users() # Reload users for up-to-date quota
+                        user_quota = users[username]['quota']
+                        quota_ok = file_size <= user_quota
+                        if quota_ok:
+                            users[username]['quota'] -= file_size # Deduct quota
+                            save_users(users)
+
+                    if not quota_ok:
+                        send_reply(conn, "Insufficient quota")
                         file_logger.warning(f"User {username} tried to upload {file_size} bytes, but only has {user_quota} bytes quota.")
                     else:
-                        conn.send("QUOTA_OK".encode()) # Signal client to send file data
-                        users[username]['quota'] -= file_size # Deduct quota
-                        save_users(users) 
-
-                        with open(safe_filepath, 'wb') as f:
-                            received_bytes = 0
-                            while received_bytes < file_size:
-                                data = conn.recv(1024)
-                                if not data: # Client disconnected during upload
-                                    file_logger.error(f"User {username} disconnected during upload of {filename_client}. Incomplete file.")
-                                    # TODO: Consider adding logic to revert quota or mark file as incomplete/corrupt
-                                    break
-                                f.write(data)
-                                received_bytes += len(data)
-                            
-                            if received_bytes == file_size:
-                                file_logger.info(f"User {username} uploaded file: {safe_filepath} ({received_bytes} bytes)")
-                                conn.send(f"File '{filename_client}' uploaded successfully.".encode())
-                            else:
+                        send_reply(conn, "QUOTA_OK") # Signal client to send file data
+
+                        received_bytes = 0
+                        try:
+                            with open(safe_filepath, 'wb') as f:
+                                while received_bytes < file_size:
+                                    data = conn.recv(1024)
+                                    if not data: # Client disconnected during upload
+                                        file_logger.error(f"User {username} disconnected during upload of {filename_client}. Incomplete file.")
+                                        break
+                                    f.write(data)
+                                    received_bytes += len(data)
+                        finally:
+                            # Also runs if the write fails, so the reservation is never leaked
+                            if received_bytes != file_size:
                                 file_logger.error(f"User {username} upload of {filename_client} failed. Expected {file_size}, received {received_bytes}. Reverting quota.")
-                                # Attempt to revert quota if upload was incomplete
-                                users = load_users()
-                                users[username]['quota'] += (file_size - received_bytes) # Revert only the difference
-                                save_users(users)
-                                conn.send(f"Error: Incomplete upload for '{filename_client}'. Please try again.".encode())
+                                # Refund the whole reservation, the partial file is removed below
+                                with users_lock:
+                                    users = load_users()
+                                    users[username]['quota'] += file_size
+                                    save_users(users)
                                 # Clean up partially uploaded file
-                                if os.path.exists(safe_filepath):
+                                if os.path.isfile(safe_filepath):
                                     os.remove(safe_filepath)
                                     file_logger.info(f"Cleaned up incomplete file: {safe_filepath}")
+                            file_cache.invalidate(safe_filepath)
+
+                        if received_bytes == file_size:
+                            file_logger.info(f"User {username} uploaded file: {safe_filepath} ({received_bytes} bytes)")
+                            send_reply(conn, f"File '{filename_client}' uploaded successfully.")
+                        else:
+                            send_reply(conn, f"Error: Incomplete upload for '{filename_client}'. Please try again.")
 
 
                 elif command == 'download':
                     if len(command_parts) < 2:
-                        conn.send("Usage: download <filename>".encode())
+                        send_reply(conn, "Usage: download <filename>")
                         continue
                     filename_client = command_parts[1]
                     safe_filepath = get_safe_path(user_docs_dir, filename_client)
                     
                     if safe_filepath is None:
-                        conn.send(f"Access denied: Cannot download '{filename_client}' from outside your designated area.".encode())
+                        send_reply(conn, f"Access denied: Cannot download '{filename_client}' from outside your designated area.")
                         continue
 
-                    if os.path.exists(safe_filepath) and os.path.isfile(safe_filepath):
-                        file_size = os.path.getsize(safe_filepath)
-                        # Handshake for download: Server sends file size first
-                        conn.send(f"DOWNLOAD_READY {file_size}".encode()) 
-                        
-                        # Client is expected to receive this and then read file data
-                        with open(safe_filepath, 'rb') as f:
-                            while True:
-                                data = f.read(1024)
-                                if not data:
-                                    break
-                                conn.sendall(data)
+                    try:
+                        file_stat = os.stat(safe_filepath)
+                    except OSError:
+                        file_stat = None
+
+                    if file_stat is not None and stat.S_ISREG(file_stat.st_mode):
+                        # Small files are served from memory; larger ones are streamed from disk
+                        data = file_cache.get(safe_filepath, file_stat)
+                        if data is not None:
+                            # Header and contents in one write: a separate small write
+                            # would stall on Nagle's algorithm and the client's delayed ACK
+                            conn.sendall(f"DOWNLOAD_READY {len(data)}\n".encode() + data)
+                        else:
+                            # Handshake for download: Server sends file size first
+                            send_reply(conn, f"DOWNLOAD_READY {file_stat.st_size}") 
+                            
+                            # Client is expected to receive this and then read file data
+                            with open(safe_filepath, 'rb') as f:
+                                while True:
+                                    data = f.read(1024)
+                                    if not data:
+                                        break
+                                    conn.sendall(data)
                         file_logger.info(f"User {username} downloaded file: {safe_filepath}")
                     else:
-                        conn.send("File does not exist or is a directory.".encode())
+                        send_reply(conn, "File does not exist or is a directory.")
 
                 elif command == 'exit':
-                    conn.send("exit".encode())
+                    send_reply(conn, "exit")
                     break # Exit handle_client loop
 
                 elif command == 'stop':
@@ -407,14 +546,20 @@ def handle_client(conn, addr):
                         with server_lock:
                             global server_running
                             server_running = False
-                        conn.send("Server stopping".encode())
+                        send_reply(conn, "Server stopping")
                         break # Exit handle_client loop
                     else:
-                        conn.send("Insufficient privileges.".encode())
+                        send_reply(conn, "Insufficient privileges.")
+
+                elif command == 'cachestats':
+                    if username == 'admin':
+                        send_reply(conn, f"File cache: {file_cache.stats()}")
+                    else:
+                        send_reply(conn, "Insufficient privileges.")
 
                 else: # Other commands (pwd, ls, mkdir, rmdir, rmfile, rename, copy)
                     response = process_command(request, username)
-                    conn.send(response.encode())
+                    send_reply(conn, response)
         
         except socket.error as e:
             conn_logger.error(f"Socket error for {username if username else addr}: {e}")
@@ -422,7 +567,7 @@ def handle_client(conn, addr):
         except Exception as e:
             conn_logger.error(f"Unhandled error in handle_client for {username if username else addr} with request '{request if 'request' in locals() else 'N/A'}': {e}", exc_info=True)
             try:
-                conn.send(f"Server error: {e}".encode()) # Send error back to client
+                send_reply(conn, f"Server error: {e}") # Send error back to client
             except socket.error:
                 pass # Client might have already disconnected
             break 
@@ -452,10 +597,15 @@ def main():
         conn_logger.critical(f"Failed to bind or listen on port {PORT}: {e}")
         return # Exit if server cannot start
 
+    last_stats_log = time.monotonic()
     while True:
         with server_lock:
             if not server_running:
                 break
+        # Log cache counters regularly so they survive a killed process
+        if time.monotonic() - last_stats_log >= CACHE_STATS_INTERVAL:
+            conn_logger.info(f"File cache: {file_cache.stats()}")
+            last_stats_log = time.monotonic()
         try:
             conn, addr = sock.accept()
             client_thread = threading.Thread(target=handle_client, args=(conn, addr))
@@ -474,6 +624,7 @@ def main():
     for thread in client_threads:
         thread.join()
     conn_logger.info("All client threads finished.")
+    conn_logger.info(f"File cache: {file_cache.stats()}")
 
     sock.close()
     conn_logger.info("Server socket closed. Server stopped.")
@@ -0,0 +1,897 @@
+"""
+Importable client for the FTP server (ftp-server.py).
+
+Provides a blocking client (FTPClient), an asyncio client (AsyncFTPClient),
+connection pools for both, and helpers that upload or download whole
+directory trees over several parallel connections.
+
+Run as a script for a non-interactive transfer, e.g.:
+
+    python ftp_client.py --user alice --password secret -j 8 upload ./site site
+    python ftp_client.py --user alice --password secret -j 8 download site ./site
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import posixpath
+import queue
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HOST = 'localhost'
+PORT = 6666
+
+CHUNK_SIZE = 64 * 1024  # Bytes per read/write during file transfers
+REPLY_SIZE = 4096  # Bytes per recv() while reading a reply
+REPLY_LIMIT = 16 * 1024 * 1024  # Longest reply (e.g. a huge 'ls') the asyncio client accepts
+
+
+class FTPError(Exception):
+    """The server rejected a request (bad path, quota, missing file, ...)."""
+
+
+class FTPAuthError(FTPError):
+    """Login or registration was refused."""
+
+
+class FTPConnectionError(FTPError):
+    """The connection was lost; the request may succeed on a fresh connection."""
+
+
+class FTPLocalError(FTPError):
+    """A local file could not be read or written; retrying will not help."""
+
+
+# Errors after which a request is worth repeating on a fresh connection
+_TRANSIENT_ERRORS = (ConnectionError, TimeoutError, asyncio.TimeoutError, FTPConnectionError)
+
+
+# --- Protocol helpers shared by the sync and async clients ---
+
+def _check_path(path):
+    # Requests are split on whitespace by the server, so such names cannot be sent
+    if not path or any(ch.isspace() for ch in path):
+        raise FTPError(f"Unsupported path '{path}': paths must be non-empty and contain no whitespace.")
+    return path
+
+
+def _expect(reply, *ok_prefixes):
+    """Returns reply if it starts with one of ok_prefixes, raises otherwise."""
+    if reply.startswith('Server error'):
+        # The server closes the connection after reporting an unhandled error
+        raise FTPConnectionError(reply)
+    if not reply.startswith(ok_prefixes):
+        raise FTPError(reply)
+    return reply
+
+
+def _parse_ls(reply):
+    if reply.startswith('Error'):
+        raise FTPError(reply)
+    _expect(reply, '')  # Surface 'Server error' replies
+    if reply == '(empty directory)':
+        return []
+    return reply.split('; ')
+
+
+def parse_download_header(reply):
+    """Returns the file size announced by a 'DOWNLOAD_READY <size>' reply."""
+    _expect(reply, 'DOWNLOAD_READY ')
+    try:
+        return int(reply[len('DOWNLOAD_READY '):])
+    except ValueError:
+        raise FTPConnectionError(f"Malformed download header: {reply}")
+
+
+def recv_line(sock):
+    """
+    Reads one newline-terminated reply from sock.
+    Returns (reply, bytes that arrived after it, e.g. the start of a download).
+    """
+    buffer = bytearray()
+    while True:
+        data = sock.recv(REPLY_SIZE)
+        if not data:
+            raise FTPConnectionError("Server closed the connection.")
+        end = data.find(b'\n')
+        if end != -1:
+            buffer += data[:end]
+            return buffer.decode(), data[end + 1:]
+        buffer += data
+
+
+def recv_reply(sock):
+    """Reads one reply that nothing else follows until the next request."""
+    reply, extra = recv_line(sock)
+    if extra:
+        raise FTPConnectionError("Unexpected data after the server's reply, connection is out of sync.")
+    return reply
+
+
+def _check_local_file(path):
+    """Raises FTPLocalError unless path is a readable regular file."""
+    if not os.path.isfile(path):
+        raise FTPLocalError(f"Local file '{path}' does not exist or is not a file.")
+    if not os.access(path, os.R_OK):
+        raise FTPLocalError(f"Local file '{path}' is not readable.")
+
+
+def _open_local(path, mode):
+    try:
+        if 'w' in mode:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        return open(path, mode)
+    except OSError as e:
+        raise FTPLocalError(f"Cannot open local file '{path}': {e}") from e
+
+
+def _write_local(f, data):
+    try:
+        f.write(data)
+    except OSError as e:
+        raise FTPLocalError(f"Cannot write local file '{f.name}': {e}") from e
+
+
+def _recv_into(sock, f, file_size, data=b''):
+    """
+    Writes exactly file_size bytes from sock to the open file f; data holds any
+    bytes already read past the DOWNLOAD_READY header.
+    """
+    if len(data) > file_size:
+        raise FTPConnectionError("Received more data than announced, connection is out of sync.")
+    received_bytes = 0
+    while True:
+        if data:
+            _write_local(f, data)
+            received_bytes += len(data)
+        if received_bytes >= file_size:
+            return received_bytes
+        data = sock.recv(min(CHUNK_SIZE, file_size - received_bytes))
+        if not data:
+            raise FTPConnectionError(
+                f"Incomplete download for '{os.path.basename(f.name)}'. "
+                f"Expected {file_size}, received {received_bytes}.")
+
+
+def _finish_download(part_path, local_path):
+    try:
+        os.replace(part_path, local_path)
+    except OSError as e:
+        os.remove(part_path)
+        raise FTPLocalError(f"Cannot write local file '{local_path}': {e}") from e
+
+
+def send_file(sock, filepath):
+    """
+    Sends filepath once the 'upload' command has been written to sock.
+    Returns the server's confirmation; raises FTPError if the upload is refused.
+    """
+    with _open_local(filepath, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        return _send_open_file(sock, f, file_size)
+
+
+def _send_open_file(sock, f, file_size):
+
+    # 1. Server announces it is ready for the size
+    response = recv_reply(sock)
+    if response != "READY_FOR_UPLOAD_SIZE":
+        raise FTPError(response)
+
+    # 2. Send the size and wait for the quota check
+    sock.sendall(str(file_size).encode())
+    response = recv_reply(sock)
+    if response != "QUOTA_OK":
+        raise FTPError(response)
+
+    # 3. Stream the file data (zero-copy where the platform supports it)
+    sock.sendfile(f)
+
+    # 4. Server's final confirmation
+    response = recv_reply(sock)
+    if 'uploaded successfully' not in response:
+        raise FTPError(response)
+    return response
+
+
+def receive_file(sock, filepath, file_size, data=b''):
+    """
+    Writes exactly file_size bytes from sock to filepath; data holds any bytes
+    already read past the DOWNLOAD_READY header. Removes the partial file and
+    raises FTPConnectionError if the server disconnects mid-transfer.
+    """
+    part_path = filepath + '.part'
+    try:
+        with _open_local(part_path, 'wb') as f:
+            received_bytes = _recv_into(sock, f, file_size, data)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    _finish_download(part_path, filepath)
+    return received_bytes
+
+
+# --- Blocking client ---
+
+class FTPClient:
+    """
+    One authenticated connection to the server.
+
+    If the connection drops, the client reconnects (up to `retries` times) and
+    logs in again with the remembered credentials. Requests that are safe to
+    repeat (pwd, ls, mkdir, upload, download) are then sent again. rename, copy,
+    rmfile and rmdir are not: the server may already have carried them out, so
+    they raise FTPConnectionError and the caller has to check the outcome.
+    Refusals from the server (FTPError) and local file problems (FTPLocalError)
+    are never retried.
+    """
+
+    def __init__(self, host=HOST, port=PORT, username=None, password=None,
+                 timeout=30.0, retries=3, retry_delay=0.5):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.sock = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        if self.username is not None:
+            self._authenticate('login', self.username, self.password)
+
+    def login(self, username, password):
+        """Logs in as username, closing any connection made with other credentials."""
+        self.close()
+        self.username, self.password = username, password
+        self._call(lambda: None)  # Connects and authenticates
+
+    def register(self, username, password):
+        """Creates the account and leaves the connection logged in as it."""
+        self._drop()
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._authenticate('register', username, password)
+        self.username, self.password = username, password
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.sendall(b'exit')
+                recv_reply(self.sock)
+            except (OSError, FTPConnectionError):
+                pass  # Server is already gone
+        self._drop()
+
+    def _drop(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _authenticate(self, action, username, password):
+        _check_path(username)
+        _check_path(password)
+        self.sock.sendall(f"{action} {username} {password}".encode())
+        response = recv_reply(self.sock)
+        if response not in ("Authenticated", "Registered"):
+            self._drop()
+            raise FTPAuthError(response)
+
+    def _call(self, operation, retry=True):
+        """
+        Runs operation(), reconnecting on connection loss. Once operation() has
+        started it is only run again if retry is true.
+        """
+        for attempt in range(self.retries + 1):
+            started = False
+            try:
+                if self.sock is None:
+                    self.connect()
+                started = True
+                return operation()
+            except FTPLocalError:
+                self._drop()  # The request may have been cut off half-way
+                raise
+            except (OSError, FTPConnectionError) as e:
+                self._drop()
+                if started and not retry:
+                    raise FTPConnectionError(f"Connection lost, the request may or may not have been applied: {e}") from e
+                if attempt == self.retries or (started and not isinstance(e, _TRANSIENT_ERRORS)):
+                    raise FTPConnectionError(f"Giving up after {attempt + 1} attempts: {e}") from e
+                time.sleep(self.retry_delay * 2 ** attempt)
+
+    def _request(self, request):
+        self.sock.sendall(request.encode())
+        return recv_reply(self.sock)
+
+    def command(self, request, retry=False):
+        """
+        Sends a raw command and returns the server's reply. The command is only
+        sent again after a connection drop if retry is true.
+        """
+        return self._call(lambda: self._request(request), retry)
+
+    def pwd(self):
+        return self.command('pwd', retry=True)
+
+    def ls(self, path=None):
+        request = 'ls' if path is None else f'ls {_check_path(path)}'
+        return _parse_ls(self.command(request, retry=True))
+
+    def find(self, path=None):
+        """Lists everything below path in one request; directories end with '/'."""
+        request = 'find' if path is None else f'find {_check_path(path)}'
+        return _parse_ls(self.command(request, retry=True))
+
+    def mkdir(self, path):
+        return _expect(self.command(f'mkdir {_check_path(path)}', retry=True),
+                       'Directory created', 'Directory already exists')
+
+    def rmdir(self, path):
+        return _expect(self.command(f'rmdir {_check_path(path)}'), 'Directory removed')
+
+    def rmfile(self, path):
+        return _expect(self.command(f'rmfile {_check_path(path)}'), 'File removed')
+
+    def rename(self, old, new):
+        return _expect(self.command(f'rename {_check_path(old)} {_check_path(new)}'), 'Renamed from')
+
+    def copy(self, source, destination):
+        return _expect(self.command(f'copy {_check_path(source)} {_check_path(destination)}'), 'Copied')
+
+    def upload(self, local_path, remote_path=None):
+        """Uploads a local file; returns the number of bytes sent."""
+        remote_path = _check_path(remote_path or os.path.basename(local_path))
+        _check_local_file(local_path)
+
+        def operation():
+            with _open_local(local_path, 'rb') as f:
+                file_size = os.fstat(f.fileno()).st_size
+                self.sock.sendall(f'upload {remote_path}'.encode())
+                _send_open_file(self.sock, f, file_size)
+            return file_size
+        return self._call(operation)
+
+    def download(self, remote_path, local_path=None):
+        """
+        Downloads a remote file; returns the number of bytes received.
+        Data goes to '<local_path>.part' first, so a failed download never
+        clobbers an existing local file.
+        """
+        _check_path(remote_path)
+        local_path = local_path or posixpath.basename(remote_path)
+        if os.path.isdir(local_path):
+            raise FTPLocalError(f"Local path '{local_path}' is a directory.")
+        part_path = local_path + '.part'
+        f = _open_local(part_path, 'wb')
+
+        def operation():
+            f.seek(0)
+            f.truncate()
+            self.sock.sendall(f'download {remote_path}'.encode())
+            reply, data = recv_line(self.sock)
+            return _recv_into(self.sock, f, parse_download_header(reply), data)
+        try:
+            with f:
+                received_bytes = self._call(operation)
+        except BaseException:
+            os.remove(part_path)
+            raise
+        _finish_download(part_path, local_path)
+        return received_bytes
+
+
+class ClientPool:
+    """Thread-safe pool of logged-in FTPClient connections, opened on demand."""
+
+    def __init__(self, size=4, **client_kwargs):
+        self.size = size
+        self.client_kwargs = client_kwargs
+        self._idle = queue.LifoQueue()
+        self._slots = threading.Semaphore(size)
+        self._clients = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @contextlib.contextmanager
+    def connection(self):
+        self._slots.acquire()
+        try:
+            try:
+                client = self._idle.get_nowait()
+            except queue.Empty:
+                client = FTPClient(**self.client_kwargs)
+                with self._lock:
+                    self._clients.append(client)
+            try:
+                yield client
+            finally:
+                self._idle.put(client)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for client in clients:
+            client.close()
+
+
+# --- Asyncio client ---
+
+class AsyncFTPClient:
+    """asyncio counterpart of FTPClient with the same reconnect and retry rules."""
+
+    def __init__(self, host=HOST, port=PORT, username=None, password=None,
+                 timeout=30.0, retries=3, retry_delay=0.5):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.reader = None
+        self.writer = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, limit=REPLY_LIMIT), self.timeout)
+        if self.username is not None:
+            await self._authenticate('login', self.username, self.password)
+
+    async def login(self, username, password):
+        """Logs in as username, closing any connection made with other credentials."""
+        await self.close()
+        self.username, self.password = username, password
+        await self._call(self._noop)  # Connects and authenticates
+
+    async def register(self, username, password):
+        """Creates the account and leaves the connection logged in as it."""
+        self._drop()
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, limit=REPLY_LIMIT), self.timeout)
+        await self._authenticate('register', username, password)
+        self.username, self.password = username, password
+
+    async def close(self):
+        if self.writer is not None:
+            try:
+                self.writer.write(b'exit')
+                await self.writer.drain()
+                await self._read_reply()
+            except (OSError, asyncio.TimeoutError, FTPConnectionError):
+                pass  # Server is already gone
+        self._drop()
+
+    def _drop(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def _noop(self):
+        return None
+
+    async def _recv(self, size):
+        return await asyncio.wait_for(self.reader.read(size), self.timeout)
+
+    async def _read_reply(self):
+        """Reads one newline-terminated reply; later bytes stay buffered in the reader."""
+        try:
+            line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+        except ValueError as e:  # Reply longer than REPLY_LIMIT
+            raise FTPConnectionError(f"Reply too long: {e}") from e
+        if not line.endswith(b'\n'):
+            raise FTPConnectionError("Server closed the connection.")
+        return line[:-1].decode()
+
+    async def _authenticate(self, action, username, password):
+        _check_path(username)
+        _check_path(password)
+        self.writer.write(f"{action} {username} {password}".encode())
+        await self.writer.drain()
+        response = await self._read_reply()
+        if response not in ("Authenticated", "Registered"):
+            self._drop()
+            raise FTPAuthError(response)
+
+    async def _call(self, operation, retry=True):
+        """
+        Awaits operation(), reconnecting on connection loss. Once operation()
+        has started it is only run again if retry is true.
+        """
+        for attempt in range(self.retries + 1):
+            started = False
+            try:
+                if self.writer is None:
+                    await self.connect()
+                started = True
+                return await operation()
+            except FTPLocalError:
+                self._drop()  # The request may have been cut off half-way
+                raise
+            except (OSError, asyncio.TimeoutError, FTPConnectionError) as e:
+                self._drop()
+                if started and not retry:
+                    raise FTPConnectionError(f"Connection lost, the request may or may not have been applied: {e}") from e
+                if attempt == self.retries or (started and not isinstance(e, _TRANSIENT_ERRORS)):
+                    raise FTPConnectionError(f"Giving up after {attempt + 1} attempts: {e}") from e
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+    async def _request(self, request):
+        self.writer.write(request.encode())
+        await self.writer.drain()
+        return await self._read_reply()
+
+    async def _expect_reply(self, expected):
+        response = await self._read_reply()
+        if response != expected:
+            raise FTPError(response)
+
+    async def command(self, request, retry=False):
+        """
+        Sends a raw command and returns the server's reply. The command is only
+        sent again after a connection drop if retry is true.
+        """
+        return await self._call(lambda: self._request(request), retry)
+
+    async def pwd(self):
+        return await self.command('pwd', retry=True)
+
+    async def ls(self, path=None):
+        request = 'ls' if path is None else f'ls {_check_path(path)}'
+        return _parse_ls(await self.command(request, retry=True))
+
+    async def find(self, path=None):
+        """Lists everything below path in one request; directories end with '/'."""
+        request = 'find' if path is None else f'find {_check_path(path)}'
+        return _parse_ls(await self.command(request, retry=True))
+
+    async def mkdir(self, path):
+        return _expect(await self.command(f'mkdir {_check_path(path)}', retry=True),
+                       'Directory created', 'Directory already exists')
+
+    async def rmdir(self, path):
+        return _expect(await self.command(f'rmdir {_check_path(path)}'), 'Directory removed')
+
+    async def rmfile(self, path):
+        return _expect(await self.command(f'rmfile {_check_path(path)}'), 'File removed')
+
+    async def rename(self, old, new):
+        return _expect(await self.command(f'rename {_check_path(old)} {_check_path(new)}'), 'Renamed from')
+
+    async def copy(self, source, destination):
+        return _expect(await self.command(f'copy {_check_path(source)} {_check_path(destination)}'), 'Copied')
+
+    async def upload(self, local_path, remote_path=None):
+        """Uploads a local file; returns the number of bytes sent."""
+        remote_path = _check_path(remote_path or os.path.basename(local_path))
+        _check_local_file(local_path)
+
+        async def operation():
+            with _open_local(local_path, 'rb') as f:
+                file_size = os.fstat(f.fileno()).st_size
+                self.writer.write(f'upload {remote_path}'.encode())
+                await self.writer.drain()
+                await self._expect_reply("READY_FOR_UPLOAD_SIZE")
+                self.writer.write(str(file_size).encode())
+                await self.writer.drain()
+                await self._expect_reply("QUOTA_OK")
+                await asyncio.get_running_loop().sendfile(self.writer.transport, f)
+            response = await self._read_reply()
+            if 'uploaded successfully' not in response:
+                raise FTPError(response)
+            return file_size
+        return await self._call(operation)
+
+    async def download(self, remote_path, local_path=None):
+        """Downloads a remote file via '<local_path>.part'; returns the number of bytes received."""
+        _check_path(remote_path)
+        local_path = local_path or posixpath.basename(remote_path)
+        if os.path.isdir(local_path):
+            raise FTPLocalError(f"Local path '{local_path}' is a directory.")
+        part_path = local_path + '.part'
+        f = _open_local(part_path, 'wb')
+
+        async def operation():
+            f.seek(0)
+            f.truncate()
+            self.writer.write(f'download {remote_path}'.encode())
+            await self.writer.drain()
+            file_size = parse_download_header(await self._read_reply())
+            received_bytes = 0
+            while received_bytes < file_size:
+                data = await self._recv(min(CHUNK_SIZE, file_size - received_bytes))
+                if not data:
+                    raise FTPConnectionError(
+                        f"Incomplete download for '{posixpath.basename(remote_path)}'. "
+                        f"Expected {file_size}, received {received_bytes}.")
+                _write_local(f, data)
+                received_bytes += len(data)
+            return received_bytes
+        try:
+            with f:
+                received_bytes = await self._call(operation)
+        except BaseException:
+            os.remove(part_path)
+            raise
+        _finish_download(part_path, local_path)
+        return received_bytes
+
+
+class AsyncClientPool:
+    """Pool of logged-in AsyncFTPClient connections, opened on demand."""
+
+    def __init__(self, size=4, **client_kwargs):
+        self.size = size
+        self.client_kwargs = client_kwargs
+        self._idle = []
+        self._slots = asyncio.Semaphore(size)
+        self._clients = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        async with self._slots:
+            if self._idle:
+                client = self._idle.pop()
+            else:
+                client = AsyncFTPClient(**self.client_kwargs)
+                self._clients.append(client)
+            try:
+                yield client
+            finally:
+                self._idle.append(client)
+
+    async def close(self):
+        clients, self._clients, self._idle = self._clients, [], []
+        await asyncio.gather(*(client.close() for client in clients))
+
+
+# --- Directory tree transfers ---
+
+class TransferStats:
+    """Aggregate result of a tree transfer."""
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.failed = []  # (path, error message)
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, nbytes):
+        with self._lock:
+            self.files += 1
+            self.bytes += nbytes
+
+    def fail(self, path, error):
+        with self._lock:
+            self.failed.append((path, str(error)))
+
+    @property
+    def throughput(self):
+        """Bytes per second over the whole transfer."""
+        return self.bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self, verb, connections):
+        mib = 1024 * 1024
+        return (f"{verb} {self.files} files ({self.bytes / mib:.2f} MiB) in {self.elapsed:.2f}s "
+                f"- {self.throughput / mib:.2f} MiB/s over {connections} connections, "
+                f"{len(self.failed)} failed")
+
+
+def _local_tree(local_dir, remote_dir):
+    """Returns (remote dirs to create, [(local file, remote file)]) for local_dir."""
+    dirs, files = [], []
+    for root, dirnames, filenames in os.walk(local_dir):
+        dirnames.sort()
+        rel = os.path.relpath(root, local_dir)
+        remote_root = remote_dir if rel == '.' else posixpath.join(remote_dir, *rel.split(os.sep))
+        dirs.extend(posixpath.join(remote_root, d) for d in dirnames)
+        files.extend((os.path.join(root, f), posixpath.join(remote_root, f)) for f in sorted(filenames))
+    return dirs, files
+
+
+def _split_find(entries):
+    dirs = [entry.rstrip('/') for entry in entries if entry.endswith('/')]
+    files = [entry for entry in entries if not entry.endswith('/')]
+    return dirs, files
+
+
+def walk_remote(client, remote_dir='.'):
+    """
+    Returns (directories, files) below remote_dir, as paths relative to the
+    user's root. Uses a single 'find' request whatever the size of the tree.
+    """
+    return _split_find(client.find(remote_dir))
+
+
+async def async_walk_remote(client, remote_dir='.'):
+    """asyncio counterpart of walk_remote."""
+    return _split_find(await client.find(remote_dir))
+
+
+def _local_target(local_dir, remote_dir, remote_file):
+    rel = remote_file if remote_dir in ('', '.') else posixpath.relpath(remote_file, remote_dir)
+    return os.path.join(local_dir, *rel.split('/'))
+
+
+def upload_tree(pool, local_dir, remote_dir='.'):
+    """Uploads local_dir into remote_dir using every connection of pool."""
+    stats = TransferStats()
+    start = time.monotonic()
+    dirs, files = _local_tree(local_dir, remote_dir)
+    with pool.connection() as client:
+        if remote_dir not in ('', '.'):
+            client.mkdir(remote_dir)
+        for d in dirs:  # Parents come before children, so keep this sequential
+            client.mkdir(d)
+
+    def upload_one(local_path, remote_path):
+        try:
+            with pool.connection() as client:
+                stats.add(client.upload(local_path, remote_path))
+        except (FTPError, OSError) as e:
+            stats.fail(local_path, e)
+
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        for local_path, remote_path in files:
+            executor.submit(upload_one, local_path, remote_path)
+    stats.elapsed = time.monotonic() - start
+    return stats
+
+
+def download_tree(pool, remote_dir, local_dir):
+    """Downloads remote_dir into local_dir using every connection of pool."""
+    stats = TransferStats()
+    start = time.monotonic()
+    with pool.connection() as client:
+        dirs, files = walk_remote(client, remote_dir)
+    for d in dirs:  # Recreates empty directories too
+        os.makedirs(_local_target(local_dir, remote_dir, d), exist_ok=True)
+
+    def download_one(remote_path):
+        try:
+            with pool.connection() as client:
+                stats.add(client.download(remote_path, _local_target(local_dir, remote_dir, remote_path)))
+        except (FTPError, OSError) as e:
+            stats.fail(remote_path, e)
+
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        for remote_path in files:
+            executor.submit(download_one, remote_path)
+    stats.elapsed = time.monotonic() - start
+    return stats
+
+
+async def async_upload_tree(pool, local_dir, remote_dir='.'):
+    """asyncio counterpart of upload_tree."""
+    stats = TransferStats()
+    start = time.monotonic()
+    dirs, files = _local_tree(local_dir, remote_dir)
+    async with pool.connection() as client:
+        if remote_dir not in ('', '.'):
+            await client.mkdir(remote_dir)
+        for d in dirs:
+            await client.mkdir(d)
+
+    async def upload_one(local_path, remote_path):
+        try:
+            async with pool.connection() as client:
+                stats.add(await client.upload(local_path, remote_path))
+        except (FTPError, OSError) as e:
+            stats.fail(local_path, e)
+
+    await asyncio.gather(*(upload_one(l, r) for l, r in files))
+    stats.elapsed = time.monotonic() - start
+    return stats
+
+
+async def async_download_tree(pool, remote_dir, local_dir):
+    """asyncio counterpart of download_tree."""
+    stats = TransferStats()
+    start = time.monotonic()
+    async with pool.connection() as client:
+        dirs, files = await async_walk_remote(client, remote_dir)
+    for d in dirs:
+        os.makedirs(_local_target(local_dir, remote_dir, d), exist_ok=True)
+
+    async def download_one(remote_path):
+        try:
+            async with pool.connection() as client:
+                stats.add(await client.download(remote_path, _local_target(local_dir, remote_dir, remote_path)))
+        except (FTPError, OSError) as e:
+            stats.fail(remote_path, e)
+
+    await asyncio.gather(*(download_one(r) for r in files))
+    stats.elapsed = time.monotonic() - start
+    return stats
+
+
+# --- Command line interface ---
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Upload or download directory trees over parallel connections.")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--user', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('-j', '--connections', type=int, default=4, help="Number of parallel connections (default: 4)")
+    parser.add_argument('--retries', type=int, default=3, help="Reconnect attempts per request (default: 3)")
+    parser.add_argument('--asyncio', action='store_true', help="Use the asyncio client instead of threads")
+    sub = parser.add_subparsers(dest='action', required=True)
+    up = sub.add_parser('upload', help="Upload a local directory tree")
+    up.add_argument('local_dir')
+    up.add_argument('remote_dir', nargs='?', default='.')
+    down = sub.add_parser('download', help="Download a remote directory tree")
+    down.add_argument('remote_dir')
+    down.add_argument('local_dir', nargs='?', default='.')
+    args = parser.parse_args(argv)
+    if args.connections < 1:
+        parser.error("--connections must be at least 1")
+    if args.action == 'upload' and not os.path.isdir(args.local_dir):
+        parser.error(f"Local directory '{args.local_dir}' does not exist.")
+    return args
+
+
+async def _run_async(args, client_kwargs):
+    async with AsyncClientPool(args.connections, **client_kwargs) as pool:
+        if args.action == 'upload':
+            return await async_upload_tree(pool, args.local_dir, args.remote_dir)
+        return await async_download_tree(pool, args.remote_dir, args.local_dir)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    client_kwargs = dict(host=args.host, port=args.port, username=args.user,
+                         password=args.password, retries=args.retries)
+    try:
+        if args.asyncio:
+            stats = asyncio.run(_run_async(args, client_kwargs))
+        else:
+            with ClientPool(args.connections, **client_kwargs) as pool:
+                if args.action == 'upload':
+                    stats = upload_tree(pool, args.local_dir, args.remote_dir)
+                else:
+                    stats = download_tree(pool, args.remote_dir, args.local_dir)
+    except FTPError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    for path, error in stats.failed:
+        print(f"Failed: {path}: {error}", file=sys.stderr)
+    print(stats.summary('Uploaded' if args.action == 'upload' else 'Downloaded', args.connections))
+    return 1 if stats.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())